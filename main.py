@@ -1,132 +1,275 @@
 import re
 import html as htmllib
 import requests
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
-from bs4 import BeautifulSoup, Tag, NavigableString
+from functools import partial
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from lxml.html import HTMLParser, HtmlElement, document_fromstring
 
 
 class RentryArchiver:
-    WS_RE = re.compile(r"[ \t\r\f\v]+")
+    USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+    WS_RE = re.compile(r"\r\n?|\n|[ \t\f\v]+")
     ALIGN_STYLE_RE = re.compile(r"text-align\s*:\s*(left|center|right)\b", re.I)
-
-    @dataclass
+    COLOR_RE = re.compile(r"color\s*:\s*([^;]+)", re.I)
+    BLANK_LINES_RE = re.compile(r"\n{3,}")
+    INDENT_RE = re.compile(r"^(?=.*\S)", re.M)
+    ALIGN_CLASSES = {"md-center": "center", "md-right": "right"}
+    INLINE_CACHE_SIZE = 4096
+    HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+    NO_CLASSES: frozenset[str] = frozenset()
+    ARTICLE_XPATH = etree.XPath(
+        '//article[ancestor::*[contains(concat(" ", normalize-space(@class), " "), " entry-text ")]'
+        '[ancestor::*[contains(concat(" ", normalize-space(@class), " "), " render-metadata ")]]]'
+    )
+    CLIPPY_XPATH = etree.XPath('.//*[contains(concat(" ", normalize-space(@class), " "), " clippy ")]')
+
+    @dataclass(slots=True)
     class _Ctx:
         in_pre: bool = False
         list_depth: int = 0
         in_heading: bool = False
         heading_id_level: dict[str, int] = field(default_factory=dict)
-
-    def archive(self, html: str) -> str:
-        soup = BeautifulSoup(html, "html.parser")
-
-        article = (
-            soup.select_one(".render-metadata .entry-text article")
-            or soup.find("article")
-            or soup.find("main")
-            or soup.body
-        )
-        if not article:
+        inline_cache: OrderedDict[tuple, str] = field(default_factory=OrderedDict)
+
+    def __init__(self) -> None:
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = self.USER_AGENT
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        heading = self._block_heading
+        self._block_handlers = {
+            "div": self._block_div,
+            "hr": self._block_hr,
+            "h1": heading,
+            "h2": heading,
+            "h3": heading,
+            "h4": heading,
+            "h5": heading,
+            "h6": heading,
+            "p": self._block_p,
+            "ul": self._render_list,
+            "ol": self._render_list,
+            "table": self._render_table,
+            "pre": self._block_pre,
+            "span": self._block_span,
+        }
+
+        wrap = self._inline_wrap
+        self._inline_handlers = {
+            "br": self._inline_br,
+            "b": partial(wrap, mark="**"),
+            "strong": partial(wrap, mark="**"),
+            "i": partial(wrap, mark="*"),
+            "em": partial(wrap, mark="*"),
+            "s": partial(wrap, mark="~~"),
+            "del": partial(wrap, mark="~~"),
+            "mark": partial(wrap, mark="=="),
+            "code": partial(wrap, mark="`"),
+            "span": self._inline_span,
+            "a": self._inline_a,
+            "img": self._inline_img,
+        }
+
+    def archive(self, html: str | bytes, *, encoding: str | None = None) -> str:
+        article = self._find_article(html, encoding)
+        if article is None:
             raise RuntimeError("Could not locate main content area")
 
         heading_id_level: dict[str, int] = {}
-        for h in article.find_all(re.compile(r"^h[1-6]$", re.I)):
+        for h in article.iter(*self.HEADING_LEVELS):
             hid = h.get("id")
             if hid:
-                try:
-                    heading_id_level[hid] = int(h.name[1])
-                except Exception:
-                    pass
+                heading_id_level[hid] = self.HEADING_LEVELS[h.tag]
 
-        raw = self._render_children_blocks(article, self._Ctx(heading_id_level=heading_id_level))
-        return re.sub(r"\n{3,}", "\n\n", raw).strip() + "\n"
+        buf: list[str] = []
+        self._render_children_blocks(article, self._Ctx(heading_id_level=heading_id_level), buf)
+        return self._finish(buf)
 
     def archive_url(self, url: str, *, timeout: int = 30) -> str:
-        _user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
-        resp = requests.get(url, headers={"User-Agent": _user_agent}, timeout=timeout)
+        resp = self._session.get(url, timeout=timeout)
         resp.raise_for_status()
-        return self.archive(resp.text)
+        encoding = resp.encoding if "charset" in resp.headers.get("Content-Type", "").lower() else None
+        return self.archive(resp.content, encoding=encoding)
+
+    def archive_urls(
+        self, urls: Iterable[str], *, max_workers: int = 8, timeout: int = 30
+    ) -> Iterator[tuple[str, str | Exception]]:
+        """Archive urls concurrently, yielding (url, result) as each one finishes.
+
+        A URL that fails yields its exception as the result instead of
+        aborting the batch. Closing the generator early cancels the URLs
+        that have not started yet.
+        """
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {pool.submit(self.archive_url, url, timeout=timeout): url for url in urls}
+            for fut in as_completed(futures):
+                exc = fut.exception()
+                yield futures[fut], exc if exc is not None else fut.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, buf: list[str]) -> str:
+        # Trim the edges fragment-wise and append the final newline before
+        # joining, so the full text is only copied by join() and sub().
+        i, j = 0, len(buf)
+        while i < j and not buf[i].strip():
+            i += 1
+        while j > i and not buf[j - 1].strip():
+            j -= 1
+        if i == j:
+            return "\n"
+        parts = buf[i:j]
+        parts[0] = parts[0].lstrip()
+        parts[-1] = parts[-1].rstrip()
+        parts.append("\n")
+        return self.BLANK_LINES_RE.sub("\n\n", "".join(parts))
+
+    def _parse(self, html: str | bytes, encoding: str | None = None) -> HtmlElement:
+        # Parsers are not thread-safe, so each call gets its own. huge_tree
+        # lifts libxml2's nesting limit, past which it silently drops the
+        # rest of the document.
+        if isinstance(html, str):
+            try:
+                return document_fromstring(html, parser=HTMLParser(huge_tree=True))
+            except ValueError:
+                # str input with an <?xml encoding=...?> declaration
+                html, encoding = html.encode("utf-8"), "utf-8"
+        return document_fromstring(html, parser=HTMLParser(huge_tree=True, encoding=encoding))
+
+    def _find_article(self, html: str | bytes, encoding: str | None = None) -> HtmlElement | None:
+        try:
+            root = self._parse(html, encoding)
+        except etree.ParserError:
+            return None
+
+        matches = self.ARTICLE_XPATH(root)
+        if matches:
+            return matches[0]
+        for path in (".//article", ".//main", "body"):
+            found = root.find(path)
+            if found is not None:
+                return found
+        return None
 
     def _collapse_ws(self, s: str) -> str:
-        s = s.replace("\r\n", "\n").replace("\r", "\n")
-        return "\n".join(self.WS_RE.sub(" ", line) for line in s.split("\n"))
+        return self.WS_RE.sub(" ", s)
 
     def _strip_blank_lines(self, lines: list[str]) -> list[str]:
-        while lines and not lines[0].strip():
-            lines.pop(0)
-        while lines and not lines[-1].strip():
-            lines.pop()
-        return lines
+        i, j = 0, len(lines)
+        while i < j and not lines[i].strip():
+            i += 1
+        while j > i and not lines[j - 1].strip():
+            j -= 1
+        return lines[i:j]
 
     def _indent_lines(self, text: str, n: int) -> str:
-        pad = " " * n
-        return "\n".join(pad + line if line.strip() else line for line in text.splitlines())
+        # Only "\n" starts a line here; unlike str.splitlines(), form feeds,
+        # \x1c-\x1e, \x85 and \u2028/\u2029 stay inside the line untouched.
+        return self.INDENT_RE.sub(" " * n, text)
+
+    def _children(self, node: HtmlElement):
+        # lxml keeps text in .text/.tail; yield it interleaved with the child
+        # elements like a DOM childNodes list, dropping comments. Whitespace
+        # runs that span a line break become a single "\n", as BeautifulSoup
+        # did, so indentation between tags doesn't widen inline spacing.
+        text = node.text
+        if text:
+            yield "\n" if "\n" in text and not text.strip() else text
+        for c in node:
+            if isinstance(c, HtmlElement):
+                yield c
+            text = c.tail
+            if text:
+                yield "\n" if "\n" in text and not text.strip() else text
+
+    def _classes(self, node: HtmlElement) -> frozenset[str]:
+        cls = node.get("class")
+        return frozenset(cls.split()) if cls else self.NO_CLASSES
 
     def _is_all_whitespace_node(self, node) -> bool:
-        return isinstance(node, NavigableString) and not str(node).strip()
+        return isinstance(node, str) and not node.strip()
 
-    def _unwrap_header_text(self, h: Tag) -> list:
+    def _unwrap_header_text(self, h: HtmlElement) -> list:
         out = []
-        for c in h.children:
-            if isinstance(c, Tag) and c.name == "a" and "headerlink" in (c.get("class") or []):
+        for c in self._children(h):
+            if isinstance(c, HtmlElement) and c.tag == "a" and "headerlink" in self._classes(c):
                 continue
             out.append(c)
         return out
 
-    def _detect_cell_align(self, cell: Tag) -> str | None:
-        if not isinstance(cell, Tag):
+    def _detect_cell_align(self, cell: HtmlElement) -> str | None:
+        if not isinstance(cell, HtmlElement):
             return None
 
-        style = cell.get("style") or ""
-        m = self.ALIGN_STYLE_RE.search(style)
-        if m:
-            return m.group(1).lower()
+        style = cell.get("style")
+        if style:
+            m = self.ALIGN_STYLE_RE.search(style)
+            if m:
+                return m.group(1).lower()
 
-        align_attr = (cell.get("align") or "").strip().lower()
-        if align_attr in ("left", "center", "right"):
-            return align_attr
+        align_attr = cell.get("align")
+        if align_attr:
+            align_attr = align_attr.strip().lower()
+            if align_attr in ("left", "center", "right"):
+                return align_attr
 
-        cls = cell.get("class") or []
-        if "md-center" in cls:
-            return "center"
-        if "md-right" in cls:
-            return "right"
+        classes = self._classes(cell)
+        for cls, align in self.ALIGN_CLASSES.items():
+            if cls in classes:
+                return align
 
         return None
 
-    def _render_children_inlines(self, node: Tag, ctx: _Ctx) -> str:
-        return "".join(self._render_inlines(c, ctx) for c in node.children)
+    def _render_children_inlines(self, node: HtmlElement, ctx: _Ctx) -> str:
+        out = []
+        append = out.append
+        render = self._render_inlines
+        for c in self._children(node):
+            append(render(c, ctx))
+        return "".join(out)
 
     def _render_inlines(self, node, ctx: _Ctx) -> str:
-        if isinstance(node, NavigableString):
-            s = str(node)
+        if isinstance(node, str):
             if ctx.in_pre:
-                return s
-            return self._collapse_ws(s).replace("\n", " ")
-
-        if not isinstance(node, Tag):
-            return ""
-
-        name = node.name.lower()
-        classes = node.get("class") or []
-
-        if name == "br":
-            return "\n"
-
-        if name == "a" and "headerlink" in classes:
-            return ""
-
-        if name in ("b", "strong"):
-            return f"**{self._render_children_inlines(node, ctx).strip()}**"
-        if name in ("i", "em"):
-            return f"*{self._render_children_inlines(node, ctx).strip()}*"
-        if name in ("s", "del"):
-            return f"~~{self._render_children_inlines(node, ctx).strip()}~~"
-        if name == "mark":
-            return f"=={self._render_children_inlines(node, ctx).strip()}=="
-        if name == "code":
-            return f"`{self._render_children_inlines(node, ctx).strip()}`"
-
-        if name == "span" and "md-align" in classes:
+                return node
+            return self._collapse_ws(node)
+
+        handler = self._inline_handlers.get(node.tag)
+        if not handler:
+            return self._render_children_inlines(node, ctx)
+        if len(node):
+            return handler(node, ctx)
+
+        key = (node.tag, tuple(node.items()), node.text, ctx.in_pre, ctx.in_heading)
+        cache = ctx.inline_cache
+        text = cache.get(key)
+        if text is not None:
+            cache.move_to_end(key)
+            return text
+        text = handler(node, ctx)
+        cache[key] = text
+        if len(cache) > self.INLINE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return text
+
+    def _inline_wrap(self, node: HtmlElement, ctx: _Ctx, mark: str) -> str:
+        return f"{mark}{self._render_children_inlines(node, ctx).strip()}{mark}"
+
+    def _inline_br(self, node: HtmlElement, ctx: _Ctx) -> str:
+        return "\n"
+
+    def _inline_span(self, node: HtmlElement, ctx: _Ctx) -> str:
+        classes = self._classes(node)
+
+        if "md-align" in classes:
             inner = self._render_children_inlines(node, ctx).strip()
             if ctx.in_heading:
                 return inner
@@ -136,199 +279,270 @@ class RentryArchiver:
                 return f"-> {inner} ->"
             return inner
 
-        if name == "span" and "color-change" in classes:
+        if "color-change" in classes:
             style = (node.get("style") or "")
-            m = re.search(r"color\s*:\s*([^;]+)", style, flags=re.I)
+            m = self.COLOR_RE.search(style)
             color = m.group(1).strip() if m else ""
             inner = self._render_children_inlines(node, ctx).strip()
             return f"%{color}%{inner}%%" if color else inner
 
-        if name == "span" and "spoiler" in classes:
+        if "spoiler" in classes:
             inner = self._render_children_inlines(node, ctx).strip()
             return f"||{inner}||"
 
-        if name == "a":
-            href = node.get("href") or ""
-            text = self._render_children_inlines(node, ctx).strip()
-            if text and href and text == href:
-                return href
-            if not text:
-                return href
-            return f"[{text}]({href})"
-
-        if name == "img":
-            alt = node.get("alt") or ""
-            src = node.get("src") or ""
-            return f"![{alt}]({src})"
-
         return self._render_children_inlines(node, ctx)
 
-    def _render_children_blocks(self, node: Tag, ctx: _Ctx) -> str:
-        parts = []
-        for c in node.children:
-            if self._is_all_whitespace_node(c):
-                continue
-            parts.append(self._render_block(c, ctx))
-        return "".join(parts)
+    def _inline_a(self, node: HtmlElement, ctx: _Ctx) -> str:
+        if "headerlink" in self._classes(node):
+            return ""
+        href = node.get("href") or ""
+        text = self._render_children_inlines(node, ctx).strip()
+        if text and href and text == href:
+            return href
+        if not text:
+            return href
+        return f"[{text}]({href})"
+
+    def _inline_img(self, node: HtmlElement, ctx: _Ctx) -> str:
+        alt = node.get("alt") or ""
+        src = node.get("src") or ""
+        return f"![{alt}]({src})"
+
+    def _render_children_blocks(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> None:
+        self._render_blocks(self._children(node), ctx, out)
+
+    def _render_block(self, node, ctx: _Ctx, out: list[str]) -> None:
+        self._render_blocks(iter((node,)), ctx, out)
+
+    def _render_blocks(self, nodes: Iterator, ctx: _Ctx, out: list[str]) -> None:
+        # Nesting is walked with an explicit stack of (children, out, close)
+        # frames instead of recursing. Pass-through containers (plain divs,
+        # sections, ...) share their parent's buffer; blockquotes and
+        # admonitions render into their own and close() writes the result.
+        render = self._render_block_node
+        open_container = self._open_container
+        is_blank = self._is_all_whitespace_node
+        children = self._children
+        stack = [(nodes, out, None)]
+        while stack:
+            it, buf, close = stack[-1]
+            for c in it:
+                if is_blank(c):
+                    continue
+                frame = open_container(c, ctx, buf) if isinstance(c, HtmlElement) else None
+                if frame is not None:
+                    stack.append(frame)
+                    break
+                if not render(c, ctx, buf):
+                    stack.append((children(c), buf, None))
+                    break
+            else:
+                stack.pop()
+                if close is not None:
+                    close()
+
+    def _open_container(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> tuple | None:
+        if node.tag == "blockquote":
+            inner: list[str] = []
+            return self._children(node), inner, partial(self._close_blockquote, inner, out)
+
+        if node.tag == "div":
+            classes = self._classes(node)
+            if "admonition" in classes and "toc" not in classes and "codeblock" not in classes:
+                part: list[str] = []
+                parts: list[str] = []
+                return (
+                    self._admonition_body(node, part, parts),
+                    part,
+                    partial(self._close_admonition, node, ctx, classes, parts, out),
+                )
 
-    def _render_block(self, node, ctx: _Ctx) -> str:
-        if isinstance(node, NavigableString):
-            if not str(node).strip():
-                return ""
-            return self._render_inlines(node, ctx).strip() + "\n\n"
+        return None
 
-        if not isinstance(node, Tag):
-            return ""
+    def _render_block_node(self, node, ctx: _Ctx, out: list[str]) -> bool:
+        if isinstance(node, str):
+            text = self._render_inlines(node, ctx).strip()
+            if text:
+                out.append(text)
+                out.append("\n\n")
+            return True
+
+        handler = self._block_handlers.get(node.tag)
+        return handler(node, ctx, out) if handler else False
 
-        name = node.name.lower()
-        classes = node.get("class") or []
+    def _block_div(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        classes = self._classes(node)
 
-        if name == "div" and "toc" in classes:
+        if "toc" in classes:
             token = "[TOC]"
-            first_a = node.find("a", href=True)
-            if first_a:
-                href = first_a.get("href", "")
+            first_a = next((a for a in node.iter("a") if a.get("href") is not None), None)
+            if first_a is not None:
+                href = first_a.get("href")
                 if href.startswith("#"):
                     hid = href[1:]
                     lvl = ctx.heading_id_level.get(hid)
                     if isinstance(lvl, int) and 1 <= lvl <= 6:
                         token = "[TOC]" if lvl == 1 else f"[TOC{lvl}]"
-            return f"{token}\n\n"
-
-        if name == "div" and "codeblock" in classes:
-            clippy = node.select_one(".clippy")
-            if clippy and clippy.has_attr("value"):
-                raw = htmllib.unescape(clippy["value"])
+            out.append(token)
+            out.append("\n\n")
+            return True
+
+        if "codeblock" in classes:
+            # Rentry puts the full source on the copy button, so the
+            # text_content() fallback only runs for foreign markup.
+            clippy = self.CLIPPY_XPATH(node)
+            if clippy and clippy[0].get("value") is not None:
+                raw = htmllib.unescape(clippy[0].get("value"))
                 raw = raw.replace("\r\n", "\n").replace("\r", "\n")
-                return f"```\n{raw.rstrip()}\n```\n\n"
-            txt = node.get_text("\n")
-            return f"```\n{txt.rstrip()}\n```\n\n"
-
-        if name == "div" and "admonition" in classes:
-            kind = None
-            for k in ("note", "info", "warning", "danger", "greentext"):
-                if k in classes:
-                    kind = k
-                    break
-            kind = kind or "note"
-
-            title_tag = node.select_one(":scope > p.admonition-title")
-            title = self._render_children_inlines(title_tag, ctx).strip() if title_tag else ""
-
-            body_parts = []
-            for child in node.children:
-                if isinstance(child, Tag) and child.name == "p" and "admonition-title" in (child.get("class") or []):
-                    continue
-                if self._is_all_whitespace_node(child):
-                    continue
-                body_parts.append(self._render_block(child, ctx).rstrip("\n"))
-
-            body = "\n".join([p for p in body_parts if p.strip()]).strip()
-            header = f"!!! {kind}" + (f" {title}" if title else "")
-            if not body:
-                return header + "\n\n"
-            return header + "\n" + self._indent_lines(body, 4) + "\n\n"
-
-        if name == "hr":
-            return "---\n\n"
-
-        if name in ("h1", "h2", "h3", "h4", "h5", "h6"):
-            level = int(name[1])
-
-            aligned = None
-            if "md-center" in classes:
-                aligned = "center"
-            elif "md-right" in classes:
-                aligned = "right"
             else:
-                for child in node.children:
-                    if isinstance(child, Tag) and child.name.lower() == "span":
-                        ccls = child.get("class") or []
-                        if "md-align" in ccls:
-                            if "md-center" in ccls:
-                                aligned = "center"
-                            elif "md-right" in ccls:
-                                aligned = "right"
-                            break
-
-            hctx = self._Ctx(
-                in_pre=ctx.in_pre,
-                list_depth=ctx.list_depth,
-                in_heading=True,
-                heading_id_level=ctx.heading_id_level,
-            )
-
-            text = "".join(self._render_inlines(c, hctx) for c in self._unwrap_header_text(node)).strip()
-
-            if aligned == "center":
-                text = f"-> {text} <-"
-            elif aligned == "right":
-                text = f"-> {text} ->"
-
-            return f"{'#' * level} {text}\n\n"
-
-        if name == "p":
-            span_aligns = node.find_all("span", class_=lambda c: c and "md-align" in c)
-            only_align = True
-            for c in node.children:
-                if self._is_all_whitespace_node(c):
-                    continue
-                if isinstance(c, Tag) and c.name == "span" and "md-align" in (c.get("class") or []):
-                    continue
-                only_align = False
+                raw = node.text_content()
+            self._emit_fence(raw, out)
+            return True
+
+        if "ntable-wrapper" in classes:
+            tbl = node.find(".//table")
+            if tbl is not None:
+                self._render_block(tbl, ctx, out)
+            return True
+
+        return False
+
+    def _emit_fence(self, code: str, out: list[str]) -> None:
+        out.append("```\n")
+        out.append(code.rstrip())
+        out.append("\n```\n\n")
+
+    def _admonition_body(self, node: HtmlElement, part: list[str], parts: list[str]) -> Iterator:
+        # Each body child renders into `part`; the generator resumes once the
+        # child and everything nested in it is done, and collects the result.
+        for child in self._children(node):
+            if isinstance(child, HtmlElement) and child.tag == "p" and "admonition-title" in self._classes(child):
+                continue
+            if self._is_all_whitespace_node(child):
+                continue
+            yield child
+            parts.append("".join(part).rstrip("\n"))
+            part.clear()
+
+    def _close_admonition(
+        self, node: HtmlElement, ctx: _Ctx, classes: frozenset[str], parts: list[str], out: list[str]
+    ) -> None:
+        kind = None
+        for k in ("note", "info", "warning", "danger", "greentext"):
+            if k in classes:
+                kind = k
                 break
+        kind = kind or "note"
+
+        title_tag = next((c for c in node.iterchildren("p") if "admonition-title" in self._classes(c)), None)
+        title = self._render_children_inlines(title_tag, ctx).strip() if title_tag is not None else ""
+
+        body = "\n".join([p for p in parts if p.strip()]).strip()
+        out.append(f"!!! {kind}")
+        if title:
+            out.append(f" {title}")
+        if body:
+            out.append("\n")
+            out.append(self._indent_lines(body, 4))
+        out.append("\n\n")
+
+    def _block_hr(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        out.append("---\n\n")
+        return True
+
+    def _block_heading(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        level = self.HEADING_LEVELS[node.tag]
+        classes = self._classes(node)
+
+        aligned = None
+        if "md-center" in classes:
+            aligned = "center"
+        elif "md-right" in classes:
+            aligned = "right"
+        else:
+            for child in node.iterchildren("span"):
+                ccls = self._classes(child)
+                if "md-align" in ccls:
+                    if "md-center" in ccls:
+                        aligned = "center"
+                    elif "md-right" in ccls:
+                        aligned = "right"
+                    break
 
-            if only_align and span_aligns:
-                lines = [self._render_inlines(s, ctx).strip() for s in span_aligns]
-                return "\n".join(lines).rstrip() + "\n\n"
-
-            text = self._render_children_inlines(node, ctx).strip()
-            return (text + "\n\n") if text else ""
-
-        if name == "blockquote":
-            inner = self._render_children_blocks(node, ctx).strip("\n")
-            inner_lines = self._strip_blank_lines(inner.splitlines())
-            out = "\n".join([("> " + ln) if ln.strip() else ">" for ln in inner_lines])
-            return out + "\n\n"
-
-        if name in ("ul", "ol"):
-            return self._render_list(node, ctx)
-
-        if name == "div" and "ntable-wrapper" in classes:
-            tbl = node.find("table")
-            return self._render_block(tbl, ctx) if tbl else ""
-
-        if name == "table":
-            return self._render_table(node, ctx)
-
-        if name == "pre":
-            txt = node.get_text("\n")
-            return f"```\n{txt.rstrip()}\n```\n\n"
-
-        if name == "span" and "clear-floats" in classes:
-            return "!;\n\n"
-
-        return self._render_children_blocks(node, ctx)
-
-    def _render_list(self, list_tag: Tag, ctx: _Ctx) -> str:
-        ordered = (list_tag.name.lower() == "ol")
+        in_heading = ctx.in_heading
+        ctx.in_heading = True
+        try:
+            text = "".join([self._render_inlines(c, ctx) for c in self._unwrap_header_text(node)]).strip()
+        finally:
+            ctx.in_heading = in_heading
+
+        if aligned == "center":
+            text = f"-> {text} <-"
+        elif aligned == "right":
+            text = f"-> {text} ->"
+
+        out.append(f"{'#' * level} {text}\n\n")
+        return True
+
+    def _block_p(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        if not len(node):
+            text = node.text or ""
+            text = (text if ctx.in_pre else self._collapse_ws(text)).strip()
+            if text:
+                out.append(text)
+                out.append("\n\n")
+            return True
+
+        span_aligns = []
+        only_align = True
+        for c in self._children(node):
+            if self._is_all_whitespace_node(c):
+                continue
+            if isinstance(c, HtmlElement) and c.tag == "span" and "md-align" in self._classes(c):
+                span_aligns.append(c)
+                continue
+            only_align = False
+            break
+
+        if only_align and span_aligns:
+            lines = [self._render_inlines(s, ctx).strip() for s in span_aligns]
+            out.append("\n".join(lines).rstrip())
+            out.append("\n\n")
+            return True
+
+        text = self._render_children_inlines(node, ctx).strip()
+        if text:
+            out.append(text)
+            out.append("\n\n")
+        return True
+
+    def _close_blockquote(self, inner: list[str], out: list[str]) -> None:
+        inner_lines = self._strip_blank_lines("".join(inner).strip("\n").splitlines())
+        out.append("\n".join([("> " + ln) if ln.strip() else ">" for ln in inner_lines]))
+        out.append("\n\n")
+
+    def _block_pre(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        self._emit_fence(node.text_content(), out)
+        return True
+
+    def _block_span(self, node: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        if "clear-floats" in self._classes(node):
+            out.append("!;\n\n")
+            return True
+        return False
+
+    def _render_list(self, list_tag: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        ordered = (list_tag.tag == "ol")
         depth = ctx.list_depth
         base_indent = 4 * depth
 
         lines: list[str] = []
-        li_tags = list_tag.find_all("li", recursive=False)
+        li_tags = list_tag.findall("li")
+        item_ctx = self._Ctx(list_depth=depth, heading_id_level=ctx.heading_id_level, inline_cache=ctx.inline_cache)
 
         for idx, li in enumerate(li_tags):
             marker = f"{idx+1}." if ordered else "-"
-            item_lines = self._render_list_item(
-                li,
-                self._Ctx(
-                    in_pre=False,
-                    list_depth=depth,
-                    in_heading=False,
-                    heading_id_level=ctx.heading_id_level,
-                ),
-            )
+            item_lines = self._render_list_item(li, item_ctx)
             if not item_lines:
                 continue
 
@@ -340,24 +554,31 @@ class RentryArchiver:
                 else:
                     lines.append((" " * cont_indent) + extra)
 
-        return "\n".join(lines).rstrip() + "\n\n"
+        out.append("\n".join(lines).rstrip())
+        out.append("\n\n")
+        return True
 
-    def _render_list_item(self, li: Tag, ctx: _Ctx) -> list[str]:
-        classes = li.get("class") or []
+    def _render_list_item(self, li: HtmlElement, ctx: _Ctx) -> list[str]:
+        classes = self._classes(li)
         is_task = "task-list" in classes
-        checkbox = li.find("input", attrs={"type": "checkbox"})
-        checked = bool(checkbox and checkbox.has_attr("checked"))
+        checkbox = None
 
         nested_lists = []
         content_nodes = []
-        for c in li.children:
+        for c in self._children(li):
             if self._is_all_whitespace_node(c):
                 continue
-            if isinstance(c, Tag) and c.name.lower() in ("ul", "ol"):
+            if isinstance(c, HtmlElement) and c.tag in ("ul", "ol"):
                 nested_lists.append(c)
             else:
+                if checkbox is None and isinstance(c, HtmlElement) and c.tag == "input" and c.get("type") == "checkbox":
+                    checkbox = c
                 content_nodes.append(c)
 
+        if is_task and checkbox is None:
+            checkbox = next((i for i in li.iter("input") if i.get("type") == "checkbox"), None)
+        checked = checkbox is not None and checkbox.get("checked") is not None
+
         paragraphs: list[str] = []
         buffer_inline: list[str] = []
 
@@ -369,7 +590,7 @@ class RentryArchiver:
             buffer_inline = []
 
         for c in content_nodes:
-            if isinstance(c, Tag) and c.name.lower() == "p":
+            if isinstance(c, HtmlElement) and c.tag == "p":
                 flush_inline_as_para()
                 ptxt = self._render_children_inlines(c, ctx).strip()
                 if ptxt:
@@ -378,7 +599,7 @@ class RentryArchiver:
                 buffer_inline.append(self._render_inlines(c, ctx))
         flush_inline_as_para()
 
-        if is_task and checkbox:
+        if is_task and checkbox is not None:
             prefix = "[x]" if checked else "[ ]"
             if paragraphs:
                 paragraphs[0] = f"{prefix} {paragraphs[0]}".strip()
@@ -394,34 +615,35 @@ class RentryArchiver:
                 lines.append("")
             lines.extend(p.splitlines())
 
-        for nl in nested_lists:
-            nested = self._render_list(
-                nl,
-                self._Ctx(
-                    in_pre=False,
-                    list_depth=ctx.list_depth + 1,
-                    in_heading=False,
-                    heading_id_level=ctx.heading_id_level,
-                ),
-            ).rstrip("\n")
-            if nested:
-                if lines and lines[-1] != "":
-                    lines.append("")
-                lines.extend(nested.splitlines())
+        if nested_lists:
+            nested_ctx = self._Ctx(
+                list_depth=ctx.list_depth + 1,
+                heading_id_level=ctx.heading_id_level,
+                inline_cache=ctx.inline_cache,
+            )
+            for nl in nested_lists:
+                buf: list[str] = []
+                self._render_list(nl, nested_ctx, buf)
+                nested = "".join(buf).rstrip("\n")
+                if nested:
+                    if lines and lines[-1] != "":
+                        lines.append("")
+                    lines.extend(nested.splitlines())
 
         return lines
 
-    def _render_table(self, tbl: Tag, ctx: _Ctx) -> str:
-        rows = tbl.find_all("tr")
+    def _render_table(self, tbl: HtmlElement, ctx: _Ctx, out: list[str]) -> bool:
+        rows = list(tbl.iter("tr"))
         if not rows:
-            return ""
+            return True
 
-        header_cells = rows[0].find_all(["th", "td"], recursive=False)
+        header_cells = list(rows[0].iterchildren("th", "td"))
         headers = [self._render_children_inlines(c, ctx).strip() for c in header_cells]
 
+        detect_align = self._detect_cell_align
         aligns = []
         for c in header_cells:
-            a = self._detect_cell_align(c)
+            a = detect_align(c)
             if a == "center":
                 aligns.append(":---:")
             elif a == "right":
@@ -429,16 +651,16 @@ class RentryArchiver:
             else:
                 aligns.append("---")
 
-        out = []
-        out.append("| " + " | ".join(headers) + " |")
-        out.append("| " + " | ".join(aligns) + " |")
+        out.append("| " + " | ".join(headers) + " |\n")
+        out.append("| " + " | ".join(aligns) + " |\n")
 
         for r in rows[1:]:
-            cells = r.find_all(["td", "th"], recursive=False)
+            cells = list(r.iterchildren("td", "th"))
             vals = [self._render_children_inlines(c, ctx).strip().replace("\n", "\\n") for c in cells]
-            out.append("| " + " | ".join(vals) + " |")
+            out.append("| " + " | ".join(vals) + " |\n")
 
-        return "\n".join(out) + "\n\n"
+        out.append("\n")
+        return True
 
 
 if __name__ == "__main__":